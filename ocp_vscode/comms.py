@@ -1,17 +1,28 @@
 """Communication with the viewer"""
 
+import atexit
 import base64
+import collections
 import enum
+import errno
+import itertools
 import json
 import os
+import selectors
 import socket
+import struct
+import threading
+import time
 
-from pathlib import Path
+from pathlib import Path, PurePath
 
+from websockets.exceptions import ConnectionClosed
+from websockets.protocol import State
 from websockets.sync.client import connect
 
+import numpy as np
 import orjson
-from ocp_tessellate.utils import Timer
+from ocp_tessellate.utils import Timer, numpy_to_buffer_json
 from ocp_tessellate.ocp_utils import (
     is_topods_shape,
     is_toploc_location,
@@ -30,10 +41,62 @@ try:
 except:  # pylint: disable=bare-except
     JCONSOLE = False
 
+try:
+    import msgpack
+
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
 CMD_URL = "ws://127.0.0.1"
 CMD_PORT = 3939
 
 INIT_DONE = False
+# set only after port detection and connection file setup have both finished
+_INIT_COMPLETE = False
+_INIT_LOCK = threading.Lock()
+
+# Marker for missing keys, never equal to a JSON value
+_SENTINEL = object()
+
+# Cached websocket connections to the viewer, keyed by port
+_WS_CACHE = {}
+# reentrant, _flush_queue is also called with the lock held
+_WS_LOCK = threading.RLock()
+
+# Maximum size of a websocket frame when sending large messages
+FRAGMENT_SIZE = 1024 * 1024
+
+# Opt-in coalescing of fire-and-forget messages into one websocket message
+BATCH_SEND = os.environ.get("OCP_BATCH_SEND") == "1"
+# deque append/popleft are atomic, the event only wakes up the sender thread
+_QUEUE = collections.deque()
+_QUEUE_EVENT = threading.Event()
+_SENDER_THREAD = None
+
+# Opt-in MessagePack encoding of data messages
+USE_MSGPACK = os.environ.get("OCP_MSGPACK") == "1" and HAS_MSGPACK
+if os.environ.get("OCP_MSGPACK") == "1" and not HAS_MSGPACK:
+    print("OCP_MSGPACK=1 ignored, msgpack is not installed")
+
+# Callable(message_type: int, message: bytes) -> Optional[bytes] registered by a
+# viewer running in the same process, replaces the websocket when set
+_INPROC_HANDLER = None
+
+# Opt-in zstd compression of large JSON data messages, older viewers can't read them
+COMPRESS_DATA = os.environ.get("OCP_COMPRESS") == "1" and HAS_ZSTD
+if os.environ.get("OCP_COMPRESS") == "1" and not HAS_ZSTD:
+    print("OCP_COMPRESS=1 ignored, zstandard is not installed")
+COMPRESS_THRESHOLD = 64 * 1024
+_ZSTD = zstandard.ZstdCompressor(level=3, threads=-1) if COMPRESS_DATA else None
+_ZSTD_LOCK = threading.Lock()
 
 #
 # Send data to the viewer
@@ -50,7 +113,24 @@ class MessageType(enum.IntEnum):
     BACKEND = 5
     BACKEND_RESPONSE = 6
     CONFIG = 7
+    DATA_MSGPACK = 8
+    DATA_COMPRESSED = 9
+
 
+# Message tags indexed by int(MessageType), UPDATES are never sent to the viewer
+_TAGS = (None, b"D:", b"C:", None, b"L:", b"B:", b"R:", b"S:", b"M:", b"Z:")
+
+# numpy arrays are serialized by orjson without calling default.
+# Note: show() converts numpy buffers to base64 strings before sending, so this
+# only applies to numpy arrays in data passed to the send functions directly
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY  # pylint: disable=no-member
+
+_BATCH_TYPES = (
+    MessageType.DATA,
+    MessageType.BACKEND,
+    MessageType.DATA_MSGPACK,
+    MessageType.DATA_COMPRESSED,
+)
 
 __all__ = [
     "send_data",
@@ -67,39 +147,140 @@ def is_pytest():
     return os.environ.get("OCP_VSCODE_PYTEST") == "1"
 
 
+def port_check_many(ports, timeout=0.2):
+    """Check which of the ports are listening, return the set of open ports.
+
+    All ports are probed in parallel with non blocking connects, so the scan
+    takes at most timeout seconds in total.
+    """
+    open_ports = set()
+    sockets = []
+    with selectors.DefaultSelector() as selector:
+        try:
+            for port in ports:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sockets.append(s)
+                s.setblocking(False)
+                err = s.connect_ex(("127.0.0.1", port))
+                if err == 0:
+                    open_ports.add(port)
+                elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    selector.register(s, selectors.EVENT_WRITE, port)
+
+            deadline = time.monotonic() + timeout
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    selector.unregister(key.fileobj)
+                    err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err == 0:
+                        open_ports.add(key.data)
+        finally:
+            for s in sockets:
+                s.close()
+
+    return open_ports
+
+
 def port_check(port):
     """Check whether the port is listening"""
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(1)
-    result = s.connect_ex(("127.0.0.1", port)) == 0
-    if result:
-        s.close()
-    return result
+    return port in port_check_many([port])
 
 
 def default(obj):
     """Default JSON serializer."""
     if is_topods_shape(obj):
-        return base64.b64encode(serialize(obj)).decode("utf-8")
+        # base64 output is pure ascii, no need for utf-8 validation
+        return base64.b64encode(serialize(obj)).decode("ascii")
     elif is_toploc_location(obj):
         return loc_to_tq(obj)
-    elif isinstance(obj, enum.Enum):
+    # orjson serializes enums itself, this is for the stdlib json encoder.
+    # Checking the metaclass by identity avoids the isinstance MRO walk
+    elif type(obj).__class__ is enum.EnumMeta:
         return obj.value
     else:
         raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
 
+def default_msgpack(obj):
+    """Default MessagePack serializer."""
+    if is_topods_shape(obj):
+        return serialize(obj)
+    elif is_toploc_location(obj):
+        return loc_to_tq(obj)
+    elif type(obj).__class__ is enum.EnumMeta:
+        return obj.value
+    else:
+        raise TypeError(f"Object of type {type(obj)} is not MessagePack serializable")
+
+
+def numpy_to_buffer_msgpack(value):
+    """Convert numpy arrays like numpy_to_buffer_json, but keep the raw buffers.
+
+    MessagePack sends them as bin values, so no base64 encoding is needed.
+    """
+
+    def walk(obj):
+        if isinstance(obj, np.ndarray):
+            obj = np.ascontiguousarray(obj).ravel()
+            return {
+                "shape": obj.shape,
+                "dtype": str(obj.dtype),
+                "buffer": memoryview(obj).cast("B"),
+                "codec": "raw",
+            }
+        elif isinstance(obj, (tuple, list)):
+            return [walk(el) for el in obj]
+        elif isinstance(obj, dict):
+            return {k: walk(v) for k, v in obj.items()}
+        else:
+            return obj
+
+    return walk(value)
+
+
+def numpy_to_buffer(value):
+    """Convert numpy arrays for the encoding used by send_data"""
+    if USE_MSGPACK:
+        return numpy_to_buffer_msgpack(value)
+    return numpy_to_buffer_json(value)
+
+
+def _encode_json(data):
+    return orjson.dumps(  # pylint: disable=no-member
+        data, default=default, option=_ORJSON_OPTIONS
+    )
+
+
+def _encode_msgpack(data):
+    return msgpack.packb(data, default=default_msgpack, use_bin_type=True)
+
+
 def get_port():
     """Get the port"""
     if is_pytest():
         return 3939
 
-    if not INIT_DONE:
-        find_and_set_port()
-        set_connection_file()
+    _init_port()
     return CMD_PORT
 
 
+def _init_port():
+    """Find the port and set the connection file once, also across threads"""
+    global _INIT_COMPLETE  # pylint: disable=global-statement
+
+    if not _INIT_COMPLETE:
+        with _INIT_LOCK:
+            if not _INIT_COMPLETE:
+                # set_port() sets INIT_DONE before the connection file is written
+                if not INIT_DONE:
+                    find_and_set_port()
+                    set_connection_file()
+                _INIT_COMPLETE = True
+
+
 def set_port(port):
     """Set the port"""
     global CMD_PORT, INIT_DONE  # pylint: disable=global-statement
@@ -107,80 +288,254 @@ def set_port(port):
     INIT_DONE = True
 
 
-def _send(data, message_type, port=None, timeit=False):
-    """Send data to the viewer"""
-    global WS
+def _get_ws(port):
+    """Get a cached connection to the viewer on port, (re)connect if needed"""
+    ws = _WS_CACHE.get(port)
+    if ws is None or ws.protocol.state is not State.OPEN:
+        # since websockets 13 the receiver thread is a daemon and doesn't block exit
+        ws = connect(f"{CMD_URL}:{port}", max_size=2**28, close_timeout=0)
+        _WS_CACHE[port] = ws
+    return ws
 
-    if port is None:
-        if not INIT_DONE:
-            find_and_set_port()
-            set_connection_file()
-        port = CMD_PORT
+
+def _fragments(tag, j):
+    """Split tag + j into fragments of at most FRAGMENT_SIZE bytes.
+
+    The slices are memoryviews created lazily, so neither tag + j nor a frame
+    of the full payload size (the client masks every frame into a new buffer)
+    is ever built.
+    """
+    yield tag
+    view = memoryview(j)
+    for start in range(0, len(view), FRAGMENT_SIZE):
+        yield view[start : start + FRAGMENT_SIZE]
+
+
+def _ws_send(port, tag, j):
+    """Send tag + j over the cached connection for port, reconnect once if closed.
+
+    Messages larger than FRAGMENT_SIZE are sent as fragments of one websocket
+    message to avoid copying j, the viewer receives the reassembled message.
+    Smaller messages are sent as a single frame.
+    """
+
+    def send(ws):
+        if len(j) > FRAGMENT_SIZE:
+            ws.send(_fragments(tag, j))
+        else:
+            ws.send(tag + j)
+
+    ws = _get_ws(port)
     try:
-        with Timer(timeit, "", "json dumps", 1):
-            j = orjson.dumps(data, default=default)  # pylint: disable=no-member
-            if message_type == MessageType.COMMAND:
-                j = b"C:" + j
-            elif message_type == MessageType.DATA:
-                j = b"D:" + j
-            elif message_type == MessageType.LISTEN:
-                j = b"L:" + j
-            elif message_type == MessageType.BACKEND:
-                j = b"B:" + j
-            elif message_type == MessageType.BACKEND_RESPONSE:
-                j = b"R:" + j
-            elif message_type == MessageType.CONFIG:
-                j = b"S:" + j
-
-        with Timer(timeit, "", f"websocket connect ({message_type.name})", 1):
-            ws = connect(f"{CMD_URL}:{port}")
-            ws.send(j)
-
-        with Timer(timeit, "", f"websocket send {len(j)/1024/1024:.3f} MB", 1):
-            result = None
-            if message_type == MessageType.COMMAND:
-                try:
-                    result = json.loads(ws.recv())
-                except Exception as ex:  # pylint: disable=broad-except
-                    print(ex)
+        send(ws)
+    except ConnectionClosed:
+        # the viewer closed the cached connection
+        _WS_CACHE.pop(port, None)
+        ws = _get_ws(port)
+        send(ws)
+    return ws
+
+
+def _drain():
+    """Get all messages currently waiting in the send queue"""
+    items = []
+    while _QUEUE:
+        items.append(_QUEUE.popleft())
+    return items
+
+
+def _send_batch(items):
+    """Send queued (port, tag, message) items, one message per run of the same port.
+
+    Multiple messages are framed as b"X:" followed by a 4 byte big endian
+    length and the tagged message for each of them.
+    """
+    for port, group in itertools.groupby(items, key=lambda item: item[0]):
+        messages = [(tag, j) for _, tag, j in group]
+        if len(messages) == 1:
+            _ws_send(port, *messages[0])
+        else:
+            _ws_send(
+                port,
+                b"X:",
+                b"".join(
+                    b"".join((struct.pack(">I", len(tag) + len(j)), tag, j))
+                    for tag, j in messages
+                ),
+            )
+
+
+def _flush_queue():
+    """Send all queued messages, to keep the order before a synchronous message"""
+    with _WS_LOCK:
+        _send_batch(_drain())
+
+
+def _sender():
+    """Background thread draining the send queue"""
+    while True:
+        _QUEUE_EVENT.wait()
+        # clear before draining, so that a message put after the drain sets it again
+        _QUEUE_EVENT.clear()
+        with _WS_LOCK:
+            items = _drain()
+            if not items:
+                # already sent by a synchronous message
+                continue
             try:
-                ws.close()
-            except Exception as ex:  # pylint: disable=bare-except
-                pass
+                _send_batch(items)
+            except Exception as ex:  # pylint: disable=broad-except
+                print("Cannot send queued messages to viewer")
+                print(ex)
 
-        return result
 
-    except Exception as ex:  # pylint: disable=broad-except
-        print(
-            f"Cannot connect to viewer on port {port}, is it running and the right port provided?"
-        )
-        print(ex)
-        return None
+def _enqueue(port, tag, j):
+    """Queue a message for the background sender thread"""
+    global _SENDER_THREAD  # pylint: disable=global-statement
 
+    if _SENDER_THREAD is None:
+        with _WS_LOCK:
+            if _SENDER_THREAD is None:
+                _SENDER_THREAD = threading.Thread(target=_sender, daemon=True)
+                _SENDER_THREAD.start()
+    _QUEUE.append((port, tag, j))
+    _QUEUE_EVENT.set()
 
-def send_data(data, port=None, timeit=False):
-    """Send data to the viewer"""
-    return _send(data, MessageType.DATA, port, timeit)
 
+def _close_ws():
+    """Send pending messages and close all cached connections to the viewer"""
+    try:
+        _flush_queue()
+    except Exception:  # pylint: disable=broad-except
+        pass
+    for ws in _WS_CACHE.values():
+        try:
+            ws.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+    _WS_CACHE.clear()
+
+
+atexit.register(_close_ws)
+
+
+def register_inproc_handler(handler):
+    """Route all messages to handler instead of the websocket (None to reset).
+
+    handler is called with the int message type and the encoded message and
+    returns the encoded response for commands, else None.
+    """
+    global _INPROC_HANDLER  # pylint: disable=global-statement
+    _INPROC_HANDLER = handler
+
+
+def _make_sender(message_type, name, doc):
+    """Create the send function for message_type with its tag and flags bound"""
+    tag = _TAGS[int(message_type)]
+    compressed_tag = _TAGS[int(MessageType.DATA_COMPRESSED)]
+    batchable = message_type in _BATCH_TYPES
+    compressible = message_type == MessageType.DATA
+    with_response = message_type == MessageType.COMMAND
+    encode = (
+        _encode_msgpack if message_type == MessageType.DATA_MSGPACK else _encode_json
+    )
+
+    def _encode(data):
+        j = encode(data)
+        if compressible and COMPRESS_DATA and len(j) > COMPRESS_THRESHOLD:
+            # the compressor object must not be used concurrently
+            with _ZSTD_LOCK:
+                return compressed_tag, _ZSTD.compress(j)
+        return tag, j
+
+    def _deliver(port, send_tag, j):
+        if batchable and BATCH_SEND:
+            _enqueue(port, send_tag, j)
+            return None
+
+        result = None
+        with _WS_LOCK:
+            _flush_queue()
+            ws = _ws_send(port, send_tag, j)
+
+            if with_response:
+                try:
+                    result = orjson.loads(ws.recv())  # pylint: disable=no-member
+                except Exception as ex:  # pylint: disable=broad-except
+                    print(ex)
+        return result
 
-def send_config(config, port=None, timeit=False):
-    """Send config to the viewer"""
-    return _send(config, MessageType.CONFIG, port, timeit)
+    def _send(data, port=None, timeit=False):
+        handler = _INPROC_HANDLER
+        if handler is not None:
+            # same process, no port, compression or batching needed
+            try:
+                _flush_queue()
+                response = handler(int(message_type), encode(data))
+                if response is None:
+                    return None
+                return orjson.loads(response)  # pylint: disable=no-member
 
+            except Exception as ex:  # pylint: disable=broad-except
+                print("Cannot send message to the in-process viewer")
+                print(ex)
+                return None
 
-def send_command(data, port=None, timeit=False):
-    """Send command to the viewer"""
-    return _send(data, MessageType.COMMAND, port, timeit)
+        if port is None:
+            _init_port()
+            port = CMD_PORT
+        try:
+            # avoid the Timer context managers and message formatting when not timing
+            if not timeit:
+                return _deliver(port, *_encode(data))
+
+            with Timer(True, "", "encode", 1):
+                send_tag, j = _encode(data)
+            with Timer(True, "", f"websocket send {len(j)/1048576:.3f} MB", 1):
+                return _deliver(port, send_tag, j)
+
+        except Exception as ex:  # pylint: disable=broad-except
+            print(
+                f"Cannot connect to viewer on port {port}, "
+                "is it running and the right port provided?"
+            )
+            print(ex)
+            return None
+
+    _send.__name__ = _send.__qualname__ = name
+    _send.__doc__ = doc
+    return _send
+
+
+_send_data_json = _make_sender(
+    MessageType.DATA, "_send_data_json", "Send data to the viewer as JSON"
+)
+_send_data_msgpack = _make_sender(
+    MessageType.DATA_MSGPACK,
+    "_send_data_msgpack",
+    "Send data to the viewer as MessagePack",
+)
 
 
-def send_backend(data, port=None, timeit=False):
+def send_data(data, port=None, timeit=False):
     """Send data to the viewer"""
-    return _send(data, MessageType.BACKEND, port, timeit)
+    if USE_MSGPACK:
+        return _send_data_msgpack(data, port, timeit)
+    return _send_data_json(data, port, timeit)
 
 
-def send_response(data, port=None, timeit=False):
-    """Send data to the viewer"""
-    return _send(data, MessageType.BACKEND_RESPONSE, port, timeit)
+send_config = _make_sender(
+    MessageType.CONFIG, "send_config", "Send config to the viewer"
+)
+send_command = _make_sender(
+    MessageType.COMMAND, "send_command", "Send command to the viewer"
+)
+send_backend = _make_sender(
+    MessageType.BACKEND, "send_backend", "Send data to the viewer"
+)
+send_response = _make_sender(
+    MessageType.BACKEND_RESPONSE, "send_response", "Send data to the viewer"
+)
 
 
 #
@@ -205,17 +560,17 @@ def listener(callback):
                     if message is None:
                         continue
 
-                    message = json.loads(message)
+                    message = orjson.loads(message)  # pylint: disable=no-member
                     if "model" in message.keys():
                         callback(message["model"], MessageType.DATA)
 
                     if message.get("command") == "status":
                         changes = message["text"]
-                        new_changes = {}
-                        for k, v in changes.items():
-                            if k in last_config and last_config[k] == v:
-                                continue
-                            new_changes[k] = v
+                        new_changes = {
+                            k: v
+                            for k, v in changes.items()
+                            if last_config.get(k, _SENTINEL) != v
+                        }
                         last_config = changes
                         callback(new_changes, MessageType.UPDATES)
 
@@ -233,19 +588,19 @@ def find_and_set_port():
         port = None
         current_path = Path.cwd()
         states = get_state().items()
+        open_ports = port_check_many([int(p) for p, _ in states])
         for p, state in states:
-            if not port_check(int(p)):
+            if int(p) not in open_ports:
                 print(f"Found stale configuration for port {p}, deleting it.")
                 update_state(int(p), None, None)
                 continue
 
-            roots = state.get("roots", [])
-            for root in roots:
-                if current_path.is_relative_to(Path(root)):
-                    port = int(p)
-                    break
+            # no file system access needed, so PurePath is sufficient
+            roots = [PurePath(root) for root in state.get("roots", [])]
+            if any(current_path.is_relative_to(root) for root in roots):
+                port = int(p)
         if port is None:
-            ports = [port for port, _ in states if port_check(int(port))]
+            ports = [port for port, _ in states if int(port) in open_ports]
             if len(ports) == 1:
                 port = ports[0]
             elif len(ports) > 1:
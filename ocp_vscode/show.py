@@ -28,7 +28,7 @@ from ocp_tessellate.convert import (
     to_assembly,
     conv,
 )
-from ocp_tessellate.utils import numpy_to_buffer_json, Timer, Color
+from ocp_tessellate.utils import Timer, Color
 from ocp_tessellate.ocp_utils import (
     is_vector,
     is_topods_shape,
@@ -61,7 +61,7 @@ from ocp_vscode.config import (
     Collapse,
     check_deprecated,
 )
-from ocp_vscode.comms import send_backend, send_data, is_pytest
+from ocp_vscode.comms import send_backend, send_data, is_pytest, numpy_to_buffer
 from ocp_vscode.colors import get_colormap, web_to_rgb, BaseColorMap
 
 __all__ = ["show", "show_object", "reset_show", "show_all", "show_clear"]
@@ -266,7 +266,7 @@ def _convert(
             return (instances, shapes, states, config, count_shapes), mapping
 
         return {
-            "data": numpy_to_buffer_json(
+            "data": numpy_to_buffer(
                 dict(instances=instances, shapes=shapes, states=states),
             ),
             "type": "data",
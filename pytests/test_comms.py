@@ -0,0 +1,150 @@
+# pylint: disable=missing-class-docstring,missing-function-docstring,protected-access
+
+import socket
+import struct
+import unittest
+from unittest.mock import patch
+
+import orjson
+import ocp_vscode.comms as comms
+
+if comms.HAS_ZSTD:
+    import zstandard
+
+
+def split_batch(payload):
+    """Split the body of an X: frame into the tagged messages"""
+    messages = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = struct.unpack(">I", payload[offset : offset + 4])
+        offset += 4
+        messages.append(payload[offset : offset + length])
+        offset += length
+    return messages
+
+
+class BatchTests(unittest.TestCase):
+    def test_batch_round_trip(self):
+        sent = []
+        items = [
+            (3939, b"D:", b'{"a":1}'),
+            (3939, b"B:", b'{"model":{}}'),
+            (3940, b"D:", b"{}"),
+        ]
+        with patch.object(
+            comms, "_ws_send", lambda port, tag, j: sent.append((port, tag, j))
+        ):
+            comms._send_batch(items)
+
+        self.assertEqual(len(sent), 2)
+
+        port, tag, payload = sent[0]
+        self.assertEqual(port, 3939)
+        self.assertEqual(tag, b"X:")
+        self.assertEqual(split_batch(payload), [b'D:{"a":1}', b'B:{"model":{}}'])
+
+        # a single message for a port is sent unframed
+        self.assertEqual(sent[1], (3940, b"D:", b"{}"))
+
+
+class PortCheckTests(unittest.TestCase):
+    def test_port_check_many(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen()
+            open_port = server.getsockname()[1]
+
+            # bind without listen reserves a port that refuses connections
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as closed:
+                closed.bind(("127.0.0.1", 0))
+                closed_port = closed.getsockname()[1]
+
+                result = comms.port_check_many([open_port, closed_port])
+
+        self.assertEqual(result, {open_port})
+
+
+class CompressionTests(unittest.TestCase):
+    @unittest.skipUnless(comms.HAS_ZSTD, "zstandard is not installed")
+    def test_compressed_tag_above_threshold(self):
+        sent = []
+        small = {"a": "x" * 10}
+        large = {"a": "x" * (comms.COMPRESS_THRESHOLD + 1)}
+        with patch.object(
+            comms, "_ws_send", lambda port, tag, j: sent.append((tag, j))
+        ), patch.object(comms, "COMPRESS_DATA", True), patch.object(
+            comms, "_ZSTD", zstandard.ZstdCompressor(level=3)
+        ), patch.object(comms, "USE_MSGPACK", False):
+            comms.send_data(small, port=3939)
+            comms.send_data(large, port=3939)
+
+        self.assertEqual([tag for tag, _ in sent], [b"D:", b"Z:"])
+        self.assertEqual(sent[0][1], orjson.dumps(small))
+        self.assertEqual(
+            zstandard.ZstdDecompressor().decompress(sent[1][1]), orjson.dumps(large)
+        )
+
+
+class FragmentTests(unittest.TestCase):
+    def test_fragments_reassemble(self):
+        j = bytes(range(256)) * 10
+        with patch.object(comms, "FRAGMENT_SIZE", 1000):
+            fragments = list(comms._fragments(b"D:", j))
+
+        self.assertEqual(fragments[0], b"D:")
+        self.assertTrue(all(len(f) <= 1000 for f in fragments))
+        self.assertEqual(b"".join(fragments), b"D:" + j)
+
+    def test_small_message_single_frame(self):
+        sent = []
+
+        class FakeWebSocket:
+            def send(self, message):
+                if isinstance(message, bytes):
+                    sent.append(message)
+                else:
+                    sent.append([bytes(fragment) for fragment in message])
+
+        with patch.object(
+            comms, "_get_ws", lambda port: FakeWebSocket()
+        ), patch.object(comms, "FRAGMENT_SIZE", 1000):
+            comms._ws_send(3939, b"D:", b"x" * 1000)
+            comms._ws_send(3939, b"D:", b"x" * 1001)
+
+        self.assertEqual(sent[0], b"D:" + b"x" * 1000)
+        self.assertEqual(sent[1], [b"D:", b"x" * 1000, b"x"])
+
+
+class InprocTests(unittest.TestCase):
+    def tearDown(self):
+        comms.register_inproc_handler(None)
+
+    def test_inproc_command_response(self):
+        received = []
+
+        def handler(message_type, message):
+            received.append((message_type, message))
+            if message_type == comms.MessageType.COMMAND:
+                return b'{"status": "ok"}'
+            return None
+
+        comms.register_inproc_handler(handler)
+
+        self.assertEqual(comms.send_command("status"), {"status": "ok"})
+        self.assertIsNone(comms.send_data({"a": 1}))
+        self.assertEqual(
+            received,
+            [
+                (int(comms.MessageType.COMMAND), b'"status"'),
+                (int(comms.MessageType.DATA), b'{"a":1}'),
+            ],
+        )
+
+    def test_inproc_handler_error(self):
+        def handler(message_type, message):
+            raise RuntimeError("viewer gone")
+
+        comms.register_inproc_handler(handler)
+
+        self.assertIsNone(comms.send_command("status"))
@@ -11,9 +11,12 @@ setup_args = {
         "ocp-tessellate>=2.3.3,<2.4.0",
         "requests",
         "ipykernel",
-        "orjson",
-        "websockets>=12.0",
+        "orjson>=3.10.0",
+        "websockets>=13.0",
     ],
+    "extras_require": {
+        "fast": ["msgpack>=1.0", "zstandard>=0.22"],
+    },
     "packages": find_packages(),
     "zip_safe": False,
     "author": "Bernhard Walter",
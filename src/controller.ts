@@ -16,6 +16,7 @@
 */
 
 import * as os from "os";
+import * as zlib from "zlib";
 import * as vscode from "vscode";
 import { OCPCADViewer } from "./viewer";
 import { template } from "./display";
@@ -27,6 +28,7 @@ import { StatusManagerProvider } from "./statusManager";
 import { getPythonPath } from "./utils";
 import { getCurrentFolder } from "./utils";
 import { updateState } from "./state";
+import { decode } from "./msgpack";
 
 var serverStarted = false;
 
@@ -146,6 +148,62 @@ export class OCPCADController {
         }
     }
 
+    private handleMessage(socket: WebSocket, message: Buffer) {
+        if (message.toString("utf-8", 0, 1) === "Z") {
+            // zstd compressed model, handle it as "D:" message
+            output.debug("Received a compressed model");
+            // zstd is part of zlib since Node 22.15, not yet in the typings used here
+            const zstdDecompressSync = (zlib as any).zstdDecompressSync;
+            if (zstdDecompressSync === undefined) {
+                output.error("zstd compressed models need a newer VS Code, unset OCP_COMPRESS");
+                return;
+            }
+            message = Buffer.concat([Buffer.from("D:"), zstdDecompressSync(message.subarray(2))]);
+        }
+        if (message.toString("utf-8", 0, 1) === "M") {
+            // MessagePack encoded model, post the decoded object to the view
+            output.debug("Received a new MessagePack model");
+            this.view?.postMessage(decode(message.subarray(2)));
+            output.debug("Posted model to view");
+            if (this.splash) { this.splash = false }
+            return;
+        }
+        const raw_data = message.toString()
+        const messageType = raw_data.substring(0, 1)
+        var data = raw_data.substring(2);
+        if (messageType === "C") {
+            data = JSON.parse(data);
+            if (data === "status") {
+                socket.send(this.viewer_message);
+            } else if (data === "config") {
+                socket.send(JSON.stringify(this.config()));
+            }
+
+        } else if (messageType === "D") {
+            output.debug("Received a new model");
+            this.view?.postMessage(data);
+            output.debug("Posted model to view");
+            if (this.splash) { this.splash = false }
+
+        } else if (messageType === "S") {
+            output.debug("Received a config");
+            this.view?.postMessage(data);
+            output.debug("Posted config to view");
+
+        } else if (messageType === "L") {
+            this.pythonListener = socket;
+            output.debug("Listener registered");
+        }
+        else if (messageType === "B") {
+            this.pythonListener?.send(data);
+            output.debug("Model data sent to the backend");
+        }
+        else if (messageType === "R") {
+            this.view?.postMessage(data);
+            output.debug("Backend response received.");
+        }
+    }
+
     public startCommandServer(): Promise<boolean> {
         return new Promise<boolean>((resolve, reject) => {
             const httpServer = createServer();
@@ -154,41 +212,20 @@ export class OCPCADController {
             wss.on('connection', (socket) => {
                 output.info('Client connected');
 
-                socket.on('message', (message) => {
+                socket.on('message', (message: Buffer) => {
                     try {
-                        const raw_data = message.toString()
-                        const messageType = raw_data.substring(0, 1)
-                        var data = message.toString().substring(2);
-                        if (messageType === "C") {
-                            data = JSON.parse(data);
-                            if (data === "status") {
-                                socket.send(this.viewer_message);
-                            } else if (data === "config") {
-                                socket.send(JSON.stringify(this.config()));
+                        const messageType = message.toString("utf-8", 0, 1);
+                        if (messageType === "X") {
+                            // batch of messages: 4 byte big endian length + message
+                            let offset = 2;
+                            while (offset < message.length) {
+                                const length = message.readUInt32BE(offset);
+                                offset += 4;
+                                this.handleMessage(socket, message.subarray(offset, offset + length));
+                                offset += length;
                             }
-
-                        } else if (messageType === "D") {
-                            output.debug("Received a new model");
-                            this.view?.postMessage(data);
-                            output.debug("Posted model to view");
-                            if (this.splash) { this.splash = false }
-
-                        } else if (messageType === "S") {
-                            output.debug("Received a config");
-                            this.view?.postMessage(data);
-                            output.debug("Posted config to view");
-
-                        } else if (messageType === "L") {
-                            this.pythonListener = socket;
-                            output.debug("Listener registered");
-                        }
-                        else if (messageType === "B") {
-                            this.pythonListener?.send(data);
-                            output.debug("Model data sent to the backend");
-                        }
-                        else if (messageType === "R") {
-                            this.view?.postMessage(data);
-                            output.debug("Backend response received.");
+                        } else {
+                            this.handleMessage(socket, message);
                         }
                     } catch (error: any) {
                         output.error(`Server error: ${error.message}`);
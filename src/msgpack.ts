@@ -0,0 +1,98 @@
+/*
+   Copyright 2023 Bernhard Walter
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+      http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+*/
+
+// Minimal MessagePack decoder for the models sent by ocp_vscode (no ext types).
+// bin values are returned as standalone Uint8Arrays, so they can be posted to the view.
+
+import { TextDecoder } from "util";
+
+const textDecoder = new TextDecoder();
+
+export function decode(buffer: Uint8Array): any {
+    const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+    let offset = 0;
+
+    function bytes(length: number): Uint8Array {
+        // copy, the view must not keep the whole message buffer alive
+        const result = new Uint8Array(buffer.subarray(offset, offset + length));
+        offset += length;
+        return result;
+    }
+
+    function str(length: number): string {
+        const result = textDecoder.decode(buffer.subarray(offset, offset + length));
+        offset += length;
+        return result;
+    }
+
+    function array(length: number): any[] {
+        const result = new Array(length);
+        for (let i = 0; i < length; i++) {
+            result[i] = next();
+        }
+        return result;
+    }
+
+    function map(length: number): any {
+        const result: any = {};
+        for (let i = 0; i < length; i++) {
+            const key = next();
+            result[key] = next();
+        }
+        return result;
+    }
+
+    function next(): any {
+        const type = view.getUint8(offset++);
+        let value: any;
+
+        if (type <= 0x7f) { return type; }
+        if (type >= 0xe0) { return type - 0x100; }
+        if ((type & 0xf0) === 0x80) { return map(type & 0x0f); }
+        if ((type & 0xf0) === 0x90) { return array(type & 0x0f); }
+        if ((type & 0xe0) === 0xa0) { return str(type & 0x1f); }
+
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: value = view.getUint8(offset); offset += 1; return bytes(value);
+            case 0xc5: value = view.getUint16(offset); offset += 2; return bytes(value);
+            case 0xc6: value = view.getUint32(offset); offset += 4; return bytes(value);
+            case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+            case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+            case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+            case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+            case 0xce: value = view.getUint32(offset); offset += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+            case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+            case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+            case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+            case 0xd9: value = view.getUint8(offset); offset += 1; return str(value);
+            case 0xda: value = view.getUint16(offset); offset += 2; return str(value);
+            case 0xdb: value = view.getUint32(offset); offset += 4; return str(value);
+            case 0xdc: value = view.getUint16(offset); offset += 2; return array(value);
+            case 0xdd: value = view.getUint32(offset); offset += 4; return array(value);
+            case 0xde: value = view.getUint16(offset); offset += 2; return map(value);
+            case 0xdf: value = view.getUint32(offset); offset += 4; return map(value);
+            default:
+                throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+        }
+    }
+
+    return next();
+}